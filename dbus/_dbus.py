@@ -25,24 +25,59 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from __future__ import generators
-
 __all__ = ('Bus', 'SystemBus', 'SessionBus', 'StarterBus')
 __docformat__ = 'reStructuredText'
 
-from dbus.exceptions import DBusException
-from _dbus_bindings import (
-    BUS_DAEMON_IFACE, BUS_DAEMON_NAME, BUS_DAEMON_PATH, BUS_SESSION,
-    BUS_STARTER, BUS_SYSTEM, DBUS_START_REPLY_ALREADY_RUNNING,
-    DBUS_START_REPLY_SUCCESS, validate_bus_name,
-    validate_interface_name, validate_member_name, validate_object_path)
-from dbus.bus import BusConnection
-from dbus.lowlevel import SignalMessage
-from dbus._compat import is_py2
+import atexit
+import importlib
+import itertools
+import sys
+import threading
+import weakref
+from _thread import get_ident
 
-if is_py2:
-    from _dbus_bindings import UTF8String
+from _dbus_bindings import BUS_SESSION, BUS_STARTER, BUS_SYSTEM
+from dbus.bus import BusConnection
 
+# Bound once so Bus.__new__ does a LOAD_GLOBAL instead of walking the
+# MRO for BusConnection.__new__ on every construction.
+_BusConnection_new = BusConnection.__new__
+
+# Names that were historically re-exported from this module but are no
+# longer used by it. Importing them eagerly would drag in the whole
+# marshalling machinery just to define Bus, so they are resolved on
+# demand through the module-level __getattr__ below (PEP 562).
+_compat_exports = {
+    'DBusException': 'dbus.exceptions',
+    'SignalMessage': 'dbus.lowlevel',
+    'BUS_DAEMON_IFACE': '_dbus_bindings',
+    'BUS_DAEMON_NAME': '_dbus_bindings',
+    'BUS_DAEMON_PATH': '_dbus_bindings',
+    'DBUS_START_REPLY_ALREADY_RUNNING': '_dbus_bindings',
+    'DBUS_START_REPLY_SUCCESS': '_dbus_bindings',
+    'validate_bus_name': '_dbus_bindings',
+    'validate_interface_name': '_dbus_bindings',
+    'validate_member_name': '_dbus_bindings',
+    'validate_object_path': '_dbus_bindings',
+}
+
+
+def __getattr__(name):
+    source = _compat_exports.get(name)
+    if source is None:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    value = getattr(importlib.import_module(source), name)
+    # patch the resolved name into the module namespace: attribute
+    # lookup only falls back to this function for names missing from
+    # the module dict, so later accesses bypass it entirely
+    globals()[name] = value
+    return value
+
+
+# Bound at the bottom of the module, once Bus exists: a pre-bound .get
+# on the shared-instance mapping for the fast path in Bus.__new__.
+_shared_instances_get = None
 
 class Bus(BusConnection):
     """A connection to one of three possible standard buses, the SESSION,
@@ -53,8 +88,37 @@ class Bus(BusConnection):
     `BusConnection`, which doesn't have all this magic.
     """
 
+    __slots__ = ('_bus_type', '_cached_repr', '_owner_tid')
+
+    # Overridden by the typed subclasses: the bus type their
+    # constructor implies. Resolved through normal attribute lookup, so
+    # user-defined subclasses of SessionBus etc. inherit it.
+    _implied_bus_type = None
+
+    # Shared connections, keyed by thread ident and then by bus type.
+    # libdbus connections may not be shared between threads without
+    # paying for locking around every call, so each thread gets its own
+    # cached SessionBus/SystemBus/StarterBus. The inner mappings only
+    # hold weak references: a shared bus that the caller has dropped is
+    # collected, letting the C-level destructor close its socket,
+    # instead of keeping a file descriptor open for the process
+    # lifetime.
     _shared_instances = {}
 
+    @classmethod
+    def _prune_dead_threads(cls):
+        """Discard shared instances cached by threads that have exited.
+
+        Only called on the slow path (when a new shared connection is
+        about to be made), so the common case pays nothing for it.
+        """
+        alive = set(t.ident for t in threading.enumerate())
+        for tid in list(cls._shared_instances):
+            if tid not in alive:
+                # pop, not del: another pruner or a cross-thread
+                # close() may have removed this entry already
+                cls._shared_instances.pop(tid, None)
+
     def __new__(cls, bus_type=BusConnection.TYPE_SESSION, private=False,
                 mainloop=None):
         """Constructor, returning an existing instance where appropriate.
@@ -80,36 +144,61 @@ class Bus(BusConnection):
             converted from a wrapper around a Connection to a Connection
             subclass.
         """
-        if (not private and bus_type in cls._shared_instances):
-            return cls._shared_instances[bus_type]
+        # fast path: almost every call is a non-private request for a
+        # bus this thread already holds, so get out with as little work
+        # as possible - one .get per mapping, no membership test
+        if not private:
+            tid = get_ident()
+            instances = _shared_instances_get(tid)
+            if instances is not None:
+                try:
+                    bus = instances.get(bus_type)
+                except TypeError:
+                    # unhashable bus_type; the dispatch below turns it
+                    # into the historical ValueError
+                    bus = None
+                if bus is not None:
+                    return bus
 
         # this is a bit odd, but we create instances of the subtypes
         # so we can return the shared instances if someone tries to
         # construct one of them (otherwise we'd eg try and return an
         # instance of Bus from __new__ in SessionBus). why are there
         # three ways to construct this class? we just don't know.
-        if bus_type == BUS_SESSION:
-            subclass = SessionBus
-        elif bus_type == BUS_SYSTEM:
-            subclass = SystemBus
-        elif bus_type == BUS_STARTER:
-            subclass = StarterBus
-        else:
+        try:
+            subclass = _SUBCLASS_FOR_TYPE.get(bus_type)
+        except TypeError:
+            subclass = None
+        if subclass is None:
             raise ValueError('invalid bus_type %s' % bus_type)
 
-        bus = BusConnection.__new__(subclass, bus_type, mainloop=mainloop)
+        bus = _BusConnection_new(subclass, bus_type, mainloop=mainloop)
 
         bus._bus_type = bus_type
+        bus._cached_repr = None
+        # the ident of the thread whose cache holds this instance, so
+        # close() can evict it even when called from another thread
+        bus._owner_tid = None
 
         if not private:
-            cls._shared_instances[bus_type] = bus
+            cls._prune_dead_threads()
+            instances = cls._shared_instances.setdefault(
+                tid, weakref.WeakValueDictionary())
+            instances[bus_type] = bus
+            bus._owner_tid = tid
 
         return bus
 
     def close(self):
         t = self._bus_type
-        if self.__class__._shared_instances.get(t) is self:
-            del self.__class__._shared_instances[t]
+        tid = self._owner_tid
+        if tid is not None:
+            shared = self.__class__._shared_instances
+            instances = shared.get(tid)
+            if instances is not None and instances.get(t) is self:
+                instances.pop(t, None)
+                if not instances:
+                    shared.pop(tid, None)
         super(Bus, self).close()
 
     def get_connection(self):
@@ -124,107 +213,170 @@ class Bus(BusConnection):
                            compatibility with earlier dbus-python versions
                            where Bus was not a subclass of Connection.""")
 
-    def get_session(private=False):
-        """Static method that returns a connection to the session bus.
+    # get_session, get_system and get_starter are bound to the typed
+    # subclasses at the bottom of this module, once those exist.
 
-        :Parameters:
-            `private` : bool
-                If true, do not return a shared connection.
-        """
-        return SessionBus(private=private)
-
-    get_session = staticmethod(get_session)
-
-    def get_system(private=False):
-        """Static method that returns a connection to the system bus.
-
-        :Parameters:
-            `private` : bool
-                If true, do not return a shared connection.
-        """
-        return SystemBus(private=private)
+    # Small pools of private connections, keyed by bus type, handed out
+    # round-robin by get_pooled(). Closed at interpreter exit. The lock
+    # keeps concurrent callers from over-filling a pool while one of
+    # them is blocked connecting (which releases the GIL).
+    _pool = {}
+    _pool_counters = {}
+    _pool_lock = threading.Lock()
 
-    get_system = staticmethod(get_system)
+    @classmethod
+    def get_pooled(cls, bus_type=None, pool_size=4, mainloop=None):
+        """Return one of a bounded pool of private connections to the
+        given bus, chosen round-robin.
 
+        This is a middle ground between the shared instance (a single
+        connection which must not be used from multiple threads at
+        once) and a fresh private connection per call (a new socket and
+        Hello round-trip every time): the number of sockets is bounded
+        by `pool_size` while each connection stays lightly loaded.
 
-    def get_starter(private=False):
-        """Static method that returns a connection to the starter bus.
+        Like a shared instance, each returned connection must only be
+        used by one thread at a time.
 
         :Parameters:
-            `private` : bool
-                If true, do not return a shared connection.
+            `bus_type` : cls.TYPE_SESSION, cls.TYPE_SYSTEM or cls.TYPE_STARTER
+                Connect to the appropriate bus. The default is the type
+                implied by the class when called on one of the typed
+                subclasses (e.g. ``SystemBus.get_pooled()``), or
+                cls.TYPE_SESSION when called on `Bus` itself
+            `pool_size` : int
+                Upper bound on the number of pooled connections for
+                this bus type; the pool is filled lazily
+            `mainloop` : dbus.mainloop.NativeMainLoop
+                The main loop to use for any newly created connection.
+                The default is to use the default main loop if one has
+                been set up, or raise an exception if none has been.
         """
-        return StarterBus(private=private)
-
-    get_starter = staticmethod(get_starter)
+        if bus_type is None:
+            bus_type = cls._implied_bus_type
+            if bus_type is None:
+                bus_type = BUS_SESSION
+        # validate before touching any pool state, so a bad call cannot
+        # leave an empty pool or counter behind
+        try:
+            valid = bus_type in _SUBCLASS_FOR_TYPE
+        except TypeError:
+            valid = False
+        if not valid:
+            raise ValueError('invalid bus_type %s' % bus_type)
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1, not %r'
+                             % pool_size)
+        with cls._pool_lock:
+            pool = cls._pool.get(bus_type)
+            if pool is None:
+                pool = cls._pool[bus_type] = []
+                cls._pool_counters[bus_type] = itertools.count()
+            index = next(cls._pool_counters[bus_type]) % pool_size
+            while index >= len(pool):
+                pool.append(Bus(bus_type, private=True, mainloop=mainloop))
+            return pool[index]
 
     def __repr__(self):
-        if self._bus_type == BUS_SESSION:
-            name = 'session'
-        elif self._bus_type == BUS_SYSTEM:
-            name = 'system'
-        elif self._bus_type == BUS_STARTER:
-            name = 'starter'
-        else:
-            name = 'unknown bus type'
-
-        return '<%s.%s (%s) at %#x>' % (self.__class__.__module__,
-                                        self.__class__.__name__,
-                                        name, id(self))
+        # the class, bus type and id() of an instance never change, so
+        # the string only has to be built once
+        r = self._cached_repr
+        if r is None:
+            name = _NAME_FOR_TYPE.get(self._bus_type, _UNKNOWN_NAME)
+            r = (f'<{type(self).__module__}.{type(self).__name__} '
+                 f'({name}) at 0x{id(self):x}>')
+            self._cached_repr = r
+        return r
     __str__ = __repr__
 
 
+def _typed_bus_new(cls, private=False, mainloop=None):
+    """Shared constructor for the typed `Bus` subclasses.
+
+    The bus type is implied by the class (via its `_implied_bus_type`
+    attribute, so user-defined subclasses inherit the right one); the
+    other parameters have the same meaning as for `Bus`.
+    """
+    return Bus.__new__(cls, cls._implied_bus_type, private=private,
+                       mainloop=mainloop)
+
+
 # FIXME: Drop the subclasses here? I can't think why we'd ever want
 # polymorphism
 class SystemBus(Bus):
-    """The system-wide message bus."""
-    def __new__(cls, private=False, mainloop=None):
-        """Return a connection to the system bus.
+    """The system-wide message bus.
 
-        :Parameters:
-            `private` : bool
-                If true, never return an existing shared instance, but instead
-                return a private connection.
-            `mainloop` : dbus.mainloop.NativeMainLoop
-                The main loop to use. The default is to use the default
-                main loop if one has been set up, or raise an exception
-                if none has been.
-        """
-        return Bus.__new__(cls, Bus.TYPE_SYSTEM, mainloop=mainloop,
-                           private=private)
+    Constructed as ``SystemBus(private=False, mainloop=None)``; the
+    parameters have the same meaning as for `Bus`.
+    """
+    __slots__ = ()
+    _implied_bus_type = BUS_SYSTEM
+    __new__ = _typed_bus_new
 
 class SessionBus(Bus):
-    """The session (current login) message bus."""
-    def __new__(cls, private=False, mainloop=None):
-        """Return a connection to the session bus.
+    """The session (current login) message bus.
 
-        :Parameters:
-            `private` : bool
-                If true, never return an existing shared instance, but instead
-                return a private connection.
-            `mainloop` : dbus.mainloop.NativeMainLoop
-                The main loop to use. The default is to use the default
-                main loop if one has been set up, or raise an exception
-                if none has been.
-        """
-        return Bus.__new__(cls, Bus.TYPE_SESSION, private=private,
-                           mainloop=mainloop)
+    Constructed as ``SessionBus(private=False, mainloop=None)``; the
+    parameters have the same meaning as for `Bus`.
+    """
+    __slots__ = ()
+    _implied_bus_type = BUS_SESSION
+    __new__ = _typed_bus_new
 
 class StarterBus(Bus):
     """The bus that activated this process (only valid if
     this process was launched by DBus activation).
-    """
-    def __new__(cls, private=False, mainloop=None):
-        """Return a connection to the bus that activated this process.
 
-        :Parameters:
-            `private` : bool
-                If true, never return an existing shared instance, but instead
-                return a private connection.
-            `mainloop` : dbus.mainloop.NativeMainLoop
-                The main loop to use. The default is to use the default
-                main loop if one has been set up, or raise an exception
-                if none has been.
-        """
-        return Bus.__new__(cls, Bus.TYPE_STARTER, private=private,
-                           mainloop=mainloop)
+    Constructed as ``StarterBus(private=False, mainloop=None)``; the
+    parameters have the same meaning as for `Bus`.
+    """
+    __slots__ = ()
+    _implied_bus_type = BUS_STARTER
+    __new__ = _typed_bus_new
+
+
+# Dispatch tables for Bus.__new__ and Bus.__repr__, replacing if/elif
+# chains in those hot paths with single dict lookups. They can only be
+# built once the three subclasses exist, hence their position here.
+_SUBCLASS_FOR_TYPE = {
+    BUS_SESSION: SessionBus,
+    BUS_SYSTEM: SystemBus,
+    BUS_STARTER: StarterBus,
+}
+
+# Bus-type display names, interned so the repr path only ever touches
+# long-lived string objects.
+_SESSION_NAME = sys.intern('session')
+_SYSTEM_NAME = sys.intern('system')
+_STARTER_NAME = sys.intern('starter')
+_UNKNOWN_NAME = sys.intern('unknown bus type')
+
+_NAME_FOR_TYPE = {
+    BUS_SESSION: _SESSION_NAME,
+    BUS_SYSTEM: _SYSTEM_NAME,
+    BUS_STARTER: _STARTER_NAME,
+}
+
+# Static constructors returning a (shared unless private=True)
+# connection to the appropriate bus. These are kept for backwards
+# compatibility and aliased straight to the subclasses, so calling them
+# costs no wrapper frame.
+Bus.get_session = staticmethod(SessionBus)
+Bus.get_system = staticmethod(SystemBus)
+Bus.get_starter = staticmethod(StarterBus)
+
+
+_shared_instances_get = Bus._shared_instances.get
+
+
+def _close_pools():
+    """Close any connections created by Bus.get_pooled at exit."""
+    for pool in Bus._pool.values():
+        for bus in pool:
+            try:
+                bus.close()
+            except Exception:
+                # the connection may already have been closed
+                pass
+
+atexit.register(_close_pools)
@@ -28,6 +28,7 @@ import os
 import unittest
 import time
 import logging
+import threading
 import weakref
 
 builddir = os.path.normpath(os.environ["DBUS_TOP_BUILDDIR"])
@@ -370,6 +371,67 @@ class TestDBusBindings(unittest.TestCase):
             self.assertTrue(private_type != private_func, '%s should not equal %s' % (private_type, private_func))
             self.assertTrue(private_func != private_cls, '%s should not equal %s' % (private_func, private_cls))
 
+    def testBusPerThreadSharing(self):
+        print("\n********* Testing per-thread bus sharing *********")
+
+        # within one thread, constructing again returns the shared
+        # instance
+        self.assertTrue(dbus.SessionBus() is dbus.SessionBus())
+
+        # each thread gets its own shared instance, so a connection is
+        # never shared between threads behind the caller's back
+        from_thread = []
+        t = threading.Thread(target=lambda: from_thread.append(dbus.SessionBus()))
+        t.start()
+        t.join()
+        other = from_thread[0]
+        self.assertTrue(other is not dbus.SessionBus(),
+                        '%s should not be shared across threads' % other)
+
+        # closing a shared bus evicts it from its thread's cache, even
+        # when close() runs on a different thread
+        other.close()
+        self.assertTrue(t.ident not in dbus.Bus._shared_instances)
+
+    def testBusWeakSharing(self):
+        print("\n********* Testing weak caching of shared buses *********")
+
+        # the cache holds shared instances only weakly: dropping the
+        # last reference lets the connection be collected and a later
+        # constructor call make a fresh one
+        bus = dbus.StarterBus()
+        self.assertTrue(dbus.StarterBus() is bus)
+        ref = weakref.ref(bus)
+        del bus
+        self.assertTrue(ref() is None)
+
+    def testGetPooled(self):
+        print("\n********* Testing Bus.get_pooled *********")
+
+        first = dbus.Bus.get_pooled(pool_size=2)
+        second = dbus.Bus.get_pooled(pool_size=2)
+        third = dbus.Bus.get_pooled(pool_size=2)
+
+        # distinct connections are handed out round-robin up to
+        # pool_size, then reused
+        self.assertTrue(first is not second)
+        self.assertTrue(third is first)
+
+        # pooled connections are private, never the shared instance
+        self.assertTrue(first is not dbus.SessionBus())
+        self.assertTrue(second is not dbus.SessionBus())
+
+        # the typed subclasses pool connections to their own bus
+        pooled = dbus.StarterBus.get_pooled(pool_size=1)
+        self.assertEqual(pooled._bus_type, dbus.Bus.TYPE_STARTER)
+        self.assertTrue(dbus.StarterBus.get_pooled(pool_size=1) is pooled)
+
+        # bad arguments are rejected before any pool state is touched
+        self.assertRaises(ValueError, dbus.Bus.get_pooled, 'bad type')
+        self.assertRaises(ValueError, dbus.Bus.get_pooled, [])
+        self.assertRaises(ValueError, dbus.Bus.get_pooled, pool_size=0)
+        self.assertTrue('bad type' not in dbus.Bus._pool)
+
     def testSenderName(self):
         print('\n******** Testing sender name keyword ********')
         myself = self.iface.WhoAmI()